@@ -2,19 +2,52 @@ import json
 import os
 import tkinter as tk
 from tkinter import messagebox, ttk, filedialog
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import List, Union
-import pandas as pd
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 from datetime import datetime
 import logging
-import base64  
+import operator
+import re
+import shutil
+import sys
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import pybase64 as b64  # SIMD base64, same API as the stdlib module
+except ImportError:
+    import base64 as b64
+
+try:
+    from PIL import Image, ImageTk
+except ImportError:  # Pillow is optional; without it Tk decodes images and no thumbnails are made
+    Image = ImageTk = None
+
+if TYPE_CHECKING:
+    import pandas as pd  # Imported lazily at runtime; only the CSV exports need it
 
 logging.basicConfig(filename='hospital_management.log', level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 # ==================== DATA MODELS ====================
 
-@dataclass
+# Legacy bills were stored as "<description> <amount>" strings
+LEGACY_BILL_RE = re.compile(r'(.*) (\d+\.?\d*|\.\d+)', re.DOTALL)
+
+# Serialized field order for the to_dict methods, read in one call through attrgetter
+BILL_FIELDS = ('id', 'amount', 'description', 'date', 'status')
+PRESCRIPTION_FIELDS = ('id', 'medicine', 'description', 'date', 'image_path', 'thumb_path')
+PATIENT_FIELDS = ('id', 'name', 'age', 'ailment', 'password', 'reports')
+_bill_values = operator.attrgetter(*BILL_FIELDS)
+_prescription_values = operator.attrgetter(*PRESCRIPTION_FIELDS)
+_patient_values = operator.attrgetter(*PATIENT_FIELDS)
+
+@dataclass(slots=True)
 class Bill:
     id: int
     amount: float
@@ -23,34 +56,29 @@ class Bill:
     status: str = "Pending"  # Pending / Paid
 
     def to_dict(self):
-        return {
-            'id': self.id, 'amount': self.amount, 'description': self.description,
-            'date': self.date, 'status': self.status
-        }
+        return dict(zip(BILL_FIELDS, _bill_values(self)))
 
     @classmethod
     def from_dict(cls, data):
         return cls(**data)
 
-@dataclass
+@dataclass(slots=True)
 class Prescription:
     id: int
     medicine: str
     description: str
     date: str
-    image_base64: str = ""  # Base64 encoded image data (optional)
+    image_path: str = ""  # Path of the image file under IMAGES_DIR (optional)
+    thumb_path: str = ""  # Downscaled PNG of image_path shown by default (optional)
 
     def to_dict(self):
-        return {
-            'id': self.id, 'medicine': self.medicine, 'description': self.description,
-            'date': self.date, 'image_base64': self.image_base64
-        }
+        return dict(zip(PRESCRIPTION_FIELDS, _prescription_values(self)))
 
     @classmethod
     def from_dict(cls, data):
         return cls(**data)
 
-@dataclass
+@dataclass(slots=True)
 class Patient:
     id: int
     name: str
@@ -60,43 +88,70 @@ class Patient:
     reports: List[str] = field(default_factory=list)
     bills: List[Bill] = field(default_factory=list)
     prescriptions: List[Prescription] = field(default_factory=list)
+    # False while bills/prescriptions still hold the raw records (see from_dict_shallow)
+    materialized: bool = field(default=True, repr=False, compare=False)
+    # Bumped on every bill change; keys the (version, DataFrame) memo used by the bills export
+    bills_version: int = field(default=0, repr=False, compare=False)
+    bills_frame_cache: Optional[tuple] = field(default=None, repr=False, compare=False)
 
     def to_dict(self):
-        return {
-            'id': self.id, 'name': self.name, 'age': self.age, 'ailment': self.ailment,
-            'password': self.password, 'reports': self.reports,
-            'bills': [b.to_dict() for b in self.bills],
-            'prescriptions': [p.to_dict() for p in self.prescriptions]
-        }
+        record = dict(zip(PATIENT_FIELDS, _patient_values(self)))
+        if self.materialized:
+            record['bills'] = [b.to_dict() for b in self.bills]
+            record['prescriptions'] = [p.to_dict() for p in self.prescriptions]
+        else:
+            # Untouched since load, so the raw records are still current
+            record['bills'] = self.bills
+            record['prescriptions'] = self.prescriptions
+        return record
 
-    @classmethod
-    def from_dict(cls, data):
-        bills_data = data.get('bills', [])
+    def total_due(self) -> float:
+        return sum(b.amount for b in self.bills if b.status == "Pending")
+
+    # Bills and prescriptions are kept sorted by id (see materialize), so the last entry holds the max
+    def next_bill_id(self) -> int:
+        return self.bills[-1].id + 1 if self.bills else 1
+
+    def next_prescription_id(self) -> int:
+        return self.prescriptions[-1].id + 1 if self.prescriptions else 1
+
+    def materialize(self):
+        """Turn raw bill/prescription records into Bill/Prescription objects; no-op once done."""
+        if self.materialized:
+            return
+        bills_data = self.bills
         # Handle legacy string bills
         if bills_data and isinstance(bills_data[0], str):
-            converted = []
-            for i, old in enumerate(bills_data, 1):
-                try:
-                    parts = old.rsplit(' ', 1)
-                    if len(parts) == 2 and parts[1].replace('.', '', 1).isdigit():
-                        desc, amt = parts[0].strip(), float(parts[1])
-                    else:
-                        desc, amt = old, 0.0
-                    converted.append(Bill(i, amt, desc, "2025-01-01", "Pending"))
-                except:
-                    converted.append(Bill(i, 0.0, old, "2025-01-01", "Pending"))
-            bills = converted
+            matches = map(LEGACY_BILL_RE.fullmatch, bills_data)
+            self.bills = [Bill(i, float(m[2]), m[1].strip(), "2025-01-01", "Pending") if m
+                          else Bill(i, 0.0, old, "2025-01-01", "Pending")
+                          for i, (old, m) in enumerate(zip(bills_data, matches), 1)]
         else:
-            bills = [Bill.from_dict(b) for b in bills_data]
+            self.bills = [Bill.from_dict(b) for b in bills_data]
 
-        prescriptions = [Prescription.from_dict(p) for p in data.get('prescriptions', [])]
+        self.prescriptions = [Prescription.from_dict(p) for p in self.prescriptions]
+        # New ids are always max + 1 and appended, so this is a linear pass on already ordered data
+        self.bills.sort(key=operator.attrgetter('id'))
+        self.prescriptions.sort(key=operator.attrgetter('id'))
+        self.materialized = True
 
+    @classmethod
+    def from_dict_shallow(cls, data):
+        """Build a patient whose bills/prescriptions stay raw until materialize() is called."""
+        # Ailments repeat across patients; interning shares one string object per value
         return cls(
-            data['id'], data['name'], data['age'], data['ailment'],
-            data['password'], data.get('reports', []), bills, prescriptions
+            data['id'], data['name'], data['age'], sys.intern(data['ailment']),
+            data['password'], data.get('reports', []), data.get('bills', []),
+            data.get('prescriptions', []), materialized=False
         )
 
-@dataclass
+    @classmethod
+    def from_dict(cls, data):
+        patient = cls.from_dict_shallow(data)
+        patient.materialize()
+        return patient
+
+@dataclass(slots=True)
 class Doctor:
     id: int
     name: str
@@ -108,9 +163,9 @@ class Doctor:
 
     @classmethod
     def from_dict(cls, data):
-        return cls(data['id'], data['name'], data['specialization'], data['password'])
+        return cls(data['id'], data['name'], sys.intern(data['specialization']), data['password'])
 
-@dataclass
+@dataclass(slots=True)
 class Appointment:
     id: int
     patient_id: int
@@ -127,52 +182,268 @@ class Appointment:
 
 # ==================== DATA STORAGE ====================
 
-# Use Pandas DataFrames for data management to enable easier querying, analysis, and export
-patients_df: pd.DataFrame = pd.DataFrame(columns=['id', 'name', 'age', 'ailment', 'password', 'reports', 'bills', 'prescriptions'])
-doctors_df: pd.DataFrame = pd.DataFrame(columns=['id', 'name', 'specialization', 'password'])
-appointments_df: pd.DataFrame = pd.DataFrame(columns=['id', 'patient_id', 'doctor_id', 'date', 'time'])
+# Records are kept as model objects keyed by id for O(1) lookups; DataFrames are only built for CSV export
+patients_by_id: Dict[int, Patient] = {}
+doctors_by_id: Dict[int, Doctor] = {}
+appointments_by_id: Dict[int, Appointment] = {}
+
+# Precomputed (id, id as text, lowercase name) tuples for the ID/Name search boxes
+patient_search_index: List[Tuple[int, str, str]] = []
 
-PATIENTS_FILE = 'patients.json'
+# Column layout of the flattened per-bill frame built by bills_frame for CSV export; keeps Bill.to_dict order
+BILL_COLUMNS = ['patient_id', *BILL_FIELDS]
+
+PATIENTS_FILE = 'patients.json'  # Legacy snapshot, only read to seed PATIENTS_LOG
+PATIENTS_LOG = 'patients.jsonl'  # Append-only log, one {"op", "id", "patient"} entry per line
 DOCTORS_FILE = 'doctors.json'
 APPOINTMENTS_FILE = 'appointments.json'
+IMAGES_DIR = 'images'
+THUMBNAIL_SIZE = (512, 512)
+CSV_BUFFER_SIZE = 1 << 20
+IO_POLL_MS = 50
+
+io_pool = ThreadPoolExecutor(max_workers=2)  # Image copies/thumbnails, kept off the Tk main loop
+
+def replace_file(path: str, data: bytes) -> None:
+    """Write data to a temp file next to path and atomically move it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def read_json(path: str):
+    """Parse a JSON file, using orjson when it is installed."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def write_json(path: str, records) -> None:
+    """Serialize records to a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        data = orjson.dumps(records, option=orjson.OPT_INDENT_2)
+    else:
+        # Same layout as orjson, which only supports a 2-space indent
+        data = json.dumps(records, indent=2, ensure_ascii=False).encode('utf-8')
+    replace_file(path, data)
+
+def encode_json_line(record) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record) + b'\n'
+    return json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n'
+
+def read_json_lines(path: str) -> Tuple[list, bool]:
+    """Parse a JSON Lines file into a list of records.
+
+    Appends are not fsynced, so a crash can leave a partial last line; it is
+    skipped with a warning. The returned flag is True whenever the file does
+    not end in a newline, so the caller can rewrite it before the next append
+    would be glued onto that line.
+    """
+    loads = orjson.loads if orjson is not None else json.loads
+    with open(path, 'rb') as f:
+        lines = [line for line in f if line.strip()]
+    records = [loads(line) for line in lines[:-1]]
+    if lines:
+        try:
+            records.append(loads(lines[-1]))
+        except ValueError as e:  # orjson.JSONDecodeError and json.JSONDecodeError are both ValueErrors
+            logging.warning(f"Skipping truncated last entry of {path}: {str(e)}")
+            return records, True
+        return records, not lines[-1].endswith(b'\n')
+    return records, False
+
+def write_json_lines(path: str, records) -> None:
+    """Replace a JSON Lines file with the given records."""
+    replace_file(path, b''.join(encode_json_line(r) for r in records))
+
+def append_json_lines(path: str, records) -> None:
+    with open(path, 'ab') as f:
+        f.writelines(encode_json_line(r) for r in records)
+
+# Number of entries currently in PATIENTS_LOG, used to decide when to compact it
+patients_log_lines = 0
+
+def patient_log_entry(patient: Patient) -> dict:
+    return {'op': 'update', 'id': patient.id, 'patient': patient.to_dict()}
+
+def compact_patients_log():
+    """Rewrite the patients log with a single entry per live patient."""
+    global patients_log_lines
+    write_json_lines(PATIENTS_LOG, [patient_log_entry(p) for p in patients_by_id.values()])
+    patients_log_lines = len(patients_by_id)
+
+def append_patient_updates(patient_ids):
+    """Append the current state of the given patients to the log, compacting it once it doubles."""
+    global patients_log_lines
+    append_json_lines(PATIENTS_LOG, [patient_log_entry(patients_by_id[pid]) for pid in patient_ids])
+    patients_log_lines += len(patient_ids)
+    if patients_log_lines > 2 * len(patients_by_id):
+        compact_patients_log()
+
+def prescription_image_path(patient_id: int, presc_id: int, ext: str = '') -> str:
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    return os.path.join(IMAGES_DIR, f"{patient_id}_{presc_id}{ext}")
+
+def save_prescription_image(patient_id: int, presc_id: int, raw: bytes, ext: str = '') -> str:
+    """Write prescription image bytes under IMAGES_DIR and return the stored path."""
+    path = prescription_image_path(patient_id, presc_id, ext)
+    with open(path, 'wb') as f:
+        f.write(raw)
+    return path
+
+def copy_prescription_image(patient_id: int, presc_id: int, source: str) -> str:
+    """Copy an uploaded image file under IMAGES_DIR and return the stored path."""
+    path = prescription_image_path(patient_id, presc_id, os.path.splitext(source)[1].lower())
+    shutil.copyfile(source, path)
+    return path
+
+def remove_prescription_images(presc: Prescription) -> None:
+    """Delete the stored image and thumbnail files of a prescription, if any."""
+    for path in (presc.image_path, presc.thumb_path):
+        if not path:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove {path}: {str(e)}")
+
+def make_thumbnail(image_path: str) -> str:
+    """Save a downscaled PNG next to an image and return its path, or "" if none could be made."""
+    if Image is None:
+        return ""
+    thumb_path = f"{os.path.splitext(image_path)[0]}_thumb.png"
+    try:
+        with Image.open(image_path) as im:
+            im.thumbnail(THUMBNAIL_SIZE)
+            if im.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+                im = im.convert('RGB')
+            im.save(thumb_path, 'PNG', optimize=True)
+    except Exception as e:  # Also DecompressionBombError / ValueError; the copied image is still usable
+        logging.warning(f"Thumbnail failed for {image_path}: {str(e)}")
+        return ""
+    return thumb_path
+
+def store_prescription_image(patient_id: int, presc_id: int, source: str) -> Tuple[str, str]:
+    """Copy an uploaded image and thumbnail it; safe to run on a worker thread."""
+    image_path = copy_prescription_image(patient_id, presc_id, source)
+    return image_path, make_thumbnail(image_path)
+
+@lru_cache(maxsize=16)
+def _load_photo(path: str, mtime_ns: int) -> tk.PhotoImage:
+    if ImageTk is None:
+        return tk.PhotoImage(file=path)
+    with Image.open(path) as im:
+        return ImageTk.PhotoImage(im)
+
+def load_prescription_image(path: str) -> tk.PhotoImage:
+    """Return the PhotoImage for an image file, reusing it until the file changes."""
+    return _load_photo(path, os.stat(path).st_mtime_ns)
+
+def migrate_inline_images(record: dict) -> bool:
+    """Move legacy base64 prescription images of a patient record to disk; True if any were moved."""
+    moved = False
+    for presc in record.get('prescriptions', []):
+        encoded = presc.pop('image_base64', None)
+        if encoded:
+            presc['image_path'] = save_prescription_image(record['id'], presc['id'], b64.b64decode(encoded, validate=False))
+            moved = True
+    return moved
 
 def load_data():
-    global patients_df, doctors_df, appointments_df
-
-    if os.path.exists(PATIENTS_FILE):
-        with open(PATIENTS_FILE, 'r') as f:
-            data = json.load(f)
-            patients_list = [Patient.from_dict(p) for p in data]
-            patients_df = pd.DataFrame([p.to_dict() for p in patients_list])
-
-    for path, df_name, cls in [
-        (DOCTORS_FILE, 'doctors_df', Doctor),
-        (APPOINTMENTS_FILE, 'appointments_df', Appointment)
+    global patients_log_lines
+
+    records = None
+    if os.path.exists(PATIENTS_LOG):
+        entries, needs_rewrite = read_json_lines(PATIENTS_LOG)
+        patients_log_lines = len(entries)
+        # Replay into raw records first so superseded entries are never turned into objects
+        latest = {}
+        for entry in entries:
+            if entry['op'] == 'update':
+                latest[entry['id']] = entry['patient']
+        # Compacting rewrites the log without a torn line and with a final newline, so appends start on a clean line
+        records, needs_compaction = list(latest.values()), needs_rewrite
+    elif os.path.exists(PATIENTS_FILE):
+        records, needs_compaction = read_json(PATIENTS_FILE), True
+
+    if records is not None:
+        for record in records:
+            needs_compaction |= migrate_inline_images(record)
+        patients_by_id.clear()
+        patients_by_id.update((r['id'], Patient.from_dict_shallow(r)) for r in records)
+        if needs_compaction:
+            compact_patients_log()
+
+    for path, store, cls in [
+        (DOCTORS_FILE, doctors_by_id, Doctor),
+        (APPOINTMENTS_FILE, appointments_by_id, Appointment)
     ]:
         if os.path.exists(path):
-            with open(path, 'r') as f:
-                data = json.load(f)
-                items = [cls.from_dict(item) for item in data]
-                globals()[df_name] = pd.DataFrame([item.to_dict() for item in items])
+            items = [cls.from_dict(item) for item in read_json(path)]
+            store.clear()
+            store.update((item.id, item) for item in items)
 
+    rebuild_patient_search_index()
     logging.info("Data loaded successfully.")
 
-def save_data():
-    for path, df in [
-        (PATIENTS_FILE, patients_df),
-        (DOCTORS_FILE, doctors_df),
-        (APPOINTMENTS_FILE, appointments_df)
+def save_data(which=('patients', 'doctors', 'appointments'), patient_ids=None):
+    """Write the named stores (all of them by default) back to disk.
+
+    When patient_ids is given only those patients are appended to the log,
+    otherwise the whole log is compacted.
+    """
+    if 'patients' in which:
+        if patient_ids is None:
+            compact_patients_log()
+        else:
+            append_patient_updates(patient_ids)
+
+    for name, path, store in [
+        ('doctors', DOCTORS_FILE, doctors_by_id),
+        ('appointments', APPOINTMENTS_FILE, appointments_by_id)
     ]:
-        with open(path, 'w') as f:
-            json.dump(df.to_dict(orient='records'), f, indent=4)
+        if name in which:
+            write_json(path, [item.to_dict() for item in store.values()])
 
     logging.info("Data saved successfully.")
 
-def get_next_id(df: pd.DataFrame, id_col: str = 'id') -> int:
-    """Auto-generate next ID for DataFrames."""
-    if df.empty:
-        return 1
-    return df[id_col].max() + 1
+def rebuild_patient_search_index():
+    patient_search_index[:] = [(p.id, str(p.id), p.name.lower()) for p in patients_by_id.values()]
+
+def find_patient(search: str) -> Optional[Patient]:
+    """Return the first patient whose ID or lowercase name contains the search text."""
+    if search.isdecimal() and int(search) in patients_by_id:
+        return patients_by_id[int(search)]
+    for pid, pid_text, name_lower in patient_search_index:
+        if search in pid_text or search in name_lower:
+            return patients_by_id[pid]
+    return None
+
+def get_next_id(ids) -> int:
+    """Auto-generate next ID from an iterable of existing IDs."""
+    return max(ids, default=0) + 1
+
+def bills_frame(patients) -> "pd.DataFrame":
+    """Flatten the bills of the given patients into one typed row per bill."""
+    import pandas as pd
+    df = pd.DataFrame([(p.id, *_bill_values(b)) for p in patients for b in p.bills], columns=BILL_COLUMNS)
+    df['amount'] = df['amount'].astype('float64')
+    return df
+
+def write_csv(df: "pd.DataFrame", path: str) -> None:
+    """Export a DataFrame to CSV through a large write buffer."""
+    with open(path, 'w', buffering=CSV_BUFFER_SIZE, newline='', encoding='utf-8') as f:
+        df.to_csv(f, index=False)
+
+def patient_bills_frame(patient: Patient) -> "pd.DataFrame":
+    """Export frame of one patient's bills, rebuilt only after the bills change."""
+    cache = patient.bills_frame_cache
+    if cache is None or cache[0] != patient.bills_version:
+        cache = (patient.bills_version, bills_frame([patient]).drop(columns='patient_id'))
+        patient.bills_frame_cache = cache
+    return cache[1]
 
 # ==================== MAIN GUI ====================
 
@@ -186,6 +457,11 @@ class HospitalManagementSystem(tk.Tk):
         self.role = None
         self.current_bill_patient = None
         self.current_prescription_patient = None
+        self._dirty = set()  # Stores with unsaved changes, flushed by _flush_save
+        self._dirty_patients = set()
+        self._save_job = None
+        self._pending_uploads = {}  # Future -> callable adding its prescription, see destroy()
+        self._popups = {}  # Form popups built once, then hidden and reshown
         load_data()
         self.show_login()
 
@@ -226,19 +502,10 @@ class HospitalManagementSystem(tk.Tk):
             pw = self.pass_entry.get().strip()
             role = self.role_var.get()
 
-            user = None
-            if role == "Patient":
-                mask = (patients_df['id'] == uid) & (patients_df['password'] == pw)
-                if not patients_df[mask].empty:
-                    user_dict = patients_df[mask].iloc[0].to_dict()
-                    user = Patient.from_dict(user_dict)
-            else:
-                mask = (doctors_df['id'] == uid) & (doctors_df['password'] == pw)
-                if not doctors_df[mask].empty:
-                    user_dict = doctors_df[mask].iloc[0].to_dict()
-                    user = Doctor.from_dict(user_dict)
+            store = patients_by_id if role == "Patient" else doctors_by_id
+            user = store.get(uid)
 
-            if user:
+            if user and user.password == pw:
                 self.current_user = user
                 self.role = role
                 logging.info(f"User {user.id} ({role}) logged in.")
@@ -255,6 +522,7 @@ class HospitalManagementSystem(tk.Tk):
             messagebox.showerror("Error", "An unexpected error occurred.")
 
     def show_patient_dashboard(self):
+        self.current_user.materialize()
         self.clear_window()
         tk.Label(self, text=f"Welcome, {self.current_user.name}", font=("Helvetica", 20, "bold"),
                  bg="#f1f5f9", fg="#1e293b").pack(pady=20)
@@ -273,9 +541,9 @@ class HospitalManagementSystem(tk.Tk):
         app_tree.heading("Date", text="Date")
         app_tree.heading("Time", text="Time")
 
-        patient_apps = appointments_df[appointments_df['patient_id'] == self.current_user.id]
-        for _, app in patient_apps.iterrows():
-            app_tree.insert("", "end", values=(app['id'], app['doctor_id'], app['date'], app['time']))
+        for app in appointments_by_id.values():
+            if app.patient_id == self.current_user.id:
+                app_tree.insert("", "end", values=(app.id, app.doctor_id, app.date, app.time))
         app_tree.pack(pady=10, padx=50, fill="x")
 
         # Bills Tab
@@ -289,22 +557,15 @@ class HospitalManagementSystem(tk.Tk):
         for col, txt in zip(columns, ["ID", "Date", "Description", "Amount", "Status"]):
             bill_tree.heading(col, text=txt)
             bill_tree.column(col, width=160 if col != "Description" else 240)
+        self._configure_bill_tags(bill_tree)
 
-        # Get patient's bills
-        patient_row = patients_df[patients_df['id'] == self.current_user.id].iloc[0]
-        bills = patient_row['bills']  # List of dicts
+        # Patient's bills
+        total_due = self.current_user.total_due()
 
-        bills_df = pd.DataFrame(bills) if bills else pd.DataFrame(columns=['id', 'date', 'description', 'amount', 'status'])
-        total_due = bills_df[bills_df['status'] == 'Pending']['amount'].sum() if not bills_df.empty else 0.0
+        for b in self.current_user.bills:
+            tag = "paid" if b.status == "Paid" else "pending"
+            bill_tree.insert("", "end", values=(b.id, b.date, b.description, f"Rs. {b.amount:,.2f}", b.status), tags=(tag,))
 
-        for _, bill in bills_df.iterrows():
-            tag = "paid" if bill['status'] == "Paid" else "pending"
-            bill_tree.insert("", "end", values=(
-                bill['id'], bill['date'], bill['description'], f"Rs. {bill['amount']:,.2f}", bill['status']
-            ), tags=(tag,))
-
-        bill_tree.tag_configure("pending", foreground="#dc2626", font=("Arial", 10, "bold"))
-        bill_tree.tag_configure("paid", foreground="#16a34a")
         bill_tree.pack(pady=10, padx=50, fill="x")
 
         tk.Label(bills_tab, text=f"Total Amount Due: Rs. {total_due:,.2f}",
@@ -323,11 +584,9 @@ class HospitalManagementSystem(tk.Tk):
         presc_tree.heading("Date", text="Date")
         presc_tree.heading("Image", text="Has Image")
 
-        prescriptions = patient_row['prescriptions']  # List of dicts
-        presc_df = pd.DataFrame(prescriptions) if prescriptions else pd.DataFrame()
-        for _, presc in presc_df.iterrows():
-            has_image = "Yes" if presc['image_base64'] else "No"
-            presc_tree.insert("", "end", values=(presc['id'], presc['medicine'], presc['description'], presc['date'], has_image))
+        prescriptions = self.current_user.prescriptions
+        for p in prescriptions:
+            presc_tree.insert("", "end", values=(p.id, p.medicine, p.description, p.date, "Yes" if p.image_path else "No"))
 
         presc_tree.pack(pady=10, padx=50, fill="x")
 
@@ -337,14 +596,9 @@ class HospitalManagementSystem(tk.Tk):
             if not sel:
                 return
             pid = int(presc_tree.item(sel[0])["values"][0])
-            presc_dict = next((p for p in prescriptions if p['id'] == pid), None)
-            if presc_dict and presc_dict['image_base64']:
-                image_data = base64.b64decode(presc_dict['image_base64'])
-                image_popup = tk.Toplevel(self)
-                image_popup.title("Prescription Image")
-                img = tk.PhotoImage(data=image_data)
-                tk.Label(image_popup, image=img).pack()
-                image_popup.image = img  # Keep reference
+            presc = next((p for p in prescriptions if p.id == pid), None)
+            if presc and presc.image_path:
+                self._show_prescription_image(presc)
             else:
                 messagebox.showinfo("No Image", "No image available for this prescription.")
 
@@ -373,8 +627,8 @@ class HospitalManagementSystem(tk.Tk):
             patient_tree.column(col, width=180 if col != "Name" else 280)
 
         patient_tree.pack(pady=10, padx=20, fill="both", expand=True)
-        for _, p in patients_df.iterrows():
-            patient_tree.insert("", "end", values=(p['id'], p['name'], p['age'], p['ailment']))
+        for p in patients_by_id.values():
+            patient_tree.insert("", "end", values=(p.id, p.name, p.age, p.ailment))
 
         tk.Button(patients_tab, text="Add New Patient", command=self.add_patient,
                   bg="#10b981", fg="white", font=("Arial", 11, "bold"), relief="flat").pack(side="left", padx=10, pady=10)
@@ -393,9 +647,10 @@ class HospitalManagementSystem(tk.Tk):
             app_tree.column(col, width=180 if col != "Patient" else 280)
 
         app_tree.pack(pady=10, padx=20, fill="both", expand=True)
-        for _, a in appointments_df.iterrows():
-            patient_name = patients_df[patients_df['id'] == a['patient_id']]['name'].values[0] if not patients_df[patients_df['id'] == a['patient_id']].empty else f"ID {a['patient_id']}"
-            app_tree.insert("", "end", values=(a['id'], f"{a['patient_id']} - {patient_name}", a['date'], a['time']))
+        for a in appointments_by_id.values():
+            patient = patients_by_id.get(a.patient_id)
+            patient_name = patient.name if patient else f"ID {a.patient_id}"
+            app_tree.insert("", "end", values=(a.id, f"{a.patient_id} - {patient_name}", a.date, a.time))
 
         tk.Button(apps_tab, text="Schedule New Appointment", command=self.schedule_appointment,
                   bg="#3b82f6", fg="white", font=("Arial", 11, "bold"), relief="flat").pack(pady=10)
@@ -427,6 +682,7 @@ class HospitalManagementSystem(tk.Tk):
             self.bill_tree.heading(col, text=txt)
             self.bill_tree.column(col, width=160 if col != "Description" else 250)
 
+        self._configure_bill_tags(self.bill_tree)
         self.bill_tree.pack(fill="both", expand=True, padx=20, pady=10)
 
         btn_frame = tk.Frame(billing_tab, bg="#f8fafc")
@@ -489,29 +745,21 @@ class HospitalManagementSystem(tk.Tk):
             messagebox.showwarning("Input Required", "Enter Patient ID or Name")
             return
 
-        mask = patients_df['id'].astype(str).str.contains(search) | patients_df['name'].str.lower().str.contains(search)
-        found_df = patients_df[mask]
-        if found_df.empty:
+        found = find_patient(search)
+        if found is None:
             messagebox.showerror("Not Found", "Patient not found")
             return
+        found.materialize()
 
-        found = Patient.from_dict(found_df.iloc[0].to_dict())
         self.current_bill_patient = found
         self.bill_patient_info.config(text=f"Patient: {found.name} (ID: {found.id})", fg="#1e40af", bg="#dbeafe")
 
         self.bill_tree.delete(*self.bill_tree.get_children())
-        bills = found.bills
-        bills_df = pd.DataFrame([b.to_dict() for b in bills]) if bills else pd.DataFrame()
-        total = bills_df[bills_df['status'] == 'Pending']['amount'].sum() if not bills_df.empty else 0.0
-
-        for _, b in bills_df.iterrows():
-            tag = "paid" if b['status'] == "Paid" else "pending"
-            self.bill_tree.insert("", "end", values=(
-                b['id'], b['date'], b['description'], f"Rs. {b['amount']:,.2f}", b['status']
-            ), tags=(tag,))
+        total = found.total_due()
 
-        self.bill_tree.tag_configure("pending", foreground="#dc2626", font=("Arial", 10, "bold"))
-        self.bill_tree.tag_configure("paid", foreground="#16a34a")
+        for b in found.bills:
+            tag = "paid" if b.status == "Paid" else "pending"
+            self.bill_tree.insert("", "end", values=(b.id, b.date, b.description, f"Rs. {b.amount:,.2f}", b.status), tags=(tag,))
 
         # Update total due label (create if not exists)
         if hasattr(self, 'total_due_label'):
@@ -547,9 +795,8 @@ class HospitalManagementSystem(tk.Tk):
             entries[key].pack(side="left", padx=10)
 
         # Auto-generate Bill ID
-        patient_idx = patients_df[patients_df['id'] == self.current_bill_patient.id].index[0]
-        current_bills = patients_df.at[patient_idx, 'bills']
-        bid = get_next_id(pd.DataFrame(current_bills), 'id') if current_bills else 1
+        patient = self.current_bill_patient
+        bid = patient.next_bill_id()
         tk.Label(popup, text=f"Bill ID: {bid} (Auto-generated)", bg="#f8fafc", font=("Arial", 12)).pack(pady=10)
 
         def save():
@@ -557,10 +804,10 @@ class HospitalManagementSystem(tk.Tk):
                 amount = float(entries["amount"].get())
                 date = entries["date"].get() or datetime.now().strftime("%Y-%m-%d")
                 new_bill = Bill(bid, amount, entries["description"].get(), date)
-                current_bills.append(new_bill.to_dict())
-                patients_df.at[patient_idx, 'bills'] = current_bills
-                save_data()
-                logging.info(f"New bill {bid} added for patient {self.current_bill_patient.id}")
+                patient.bills.append(new_bill)
+                patient.bills_version += 1
+                self._schedule_save('patients', patient.id)
+                logging.info(f"New bill {bid} added for patient {patient.id}")
                 messagebox.showinfo("Success", "Bill added!")
                 popup.destroy()
                 self.load_patient_bills()
@@ -576,14 +823,12 @@ class HospitalManagementSystem(tk.Tk):
         if not sel:
             return
         bid = int(self.bill_tree.item(sel[0])["values"][0])
-        patient_idx = patients_df[patients_df['id'] == self.current_bill_patient.id].index[0]
-        bills = patients_df.at[patient_idx, 'bills']
-        for b in bills:
-            if b['id'] == bid:
-                b['status'] = "Paid"
+        for b in self.current_bill_patient.bills:
+            if b.id == bid:
+                b.status = "Paid"
                 break
-        patients_df.at[patient_idx, 'bills'] = bills
-        save_data()
+        self.current_bill_patient.bills_version += 1
+        self._schedule_save('patients', self.current_bill_patient.id)
         logging.info(f"Bill {bid} marked paid for patient {self.current_bill_patient.id}")
         self.load_patient_bills()
         messagebox.showinfo("Success", "Marked as Paid")
@@ -593,11 +838,13 @@ class HospitalManagementSystem(tk.Tk):
         if not sel or not messagebox.askyesno("Confirm", "Delete this bill?"):
             return
         bid = int(self.bill_tree.item(sel[0])["values"][0])
-        patient_idx = patients_df[patients_df['id'] == self.current_bill_patient.id].index[0]
-        bills = patients_df.at[patient_idx, 'bills']
-        bills = [b for b in bills if b['id'] != bid]
-        patients_df.at[patient_idx, 'bills'] = bills
-        save_data()
+        patient = self.current_bill_patient
+        for i, bill in enumerate(patient.bills):
+            if bill.id == bid:
+                del patient.bills[i]
+                break
+        patient.bills_version += 1
+        self._schedule_save('patients', patient.id)
         logging.info(f"Bill {bid} deleted for patient {self.current_bill_patient.id}")
         self.load_patient_bills()
 
@@ -607,31 +854,26 @@ class HospitalManagementSystem(tk.Tk):
             messagebox.showwarning("Input Required", "Enter Patient ID or Name")
             return
 
-        mask = patients_df['id'].astype(str).str.contains(search) | patients_df['name'].str.lower().str.contains(search)
-        found_df = patients_df[mask]
-        if found_df.empty:
+        found = find_patient(search)
+        if found is None:
             messagebox.showerror("Not Found", "Patient not found")
             return
+        found.materialize()
 
-        found = Patient.from_dict(found_df.iloc[0].to_dict())
         self.current_prescription_patient = found
         self.presc_patient_info.config(text=f"Patient: {found.name} (ID: {found.id})", fg="#1e40af", bg="#dbeafe")
 
         self.presc_tree.delete(*self.presc_tree.get_children())
-        prescriptions = found.prescriptions
-        presc_df = pd.DataFrame([p.to_dict() for p in prescriptions]) if prescriptions else pd.DataFrame()
-
-        for _, p in presc_df.iterrows():
-            has_image = "Yes" if p['image_base64'] else "No"
-            self.presc_tree.insert("", "end", values=(
-                p['id'], p['medicine'], p['description'], p['date'], has_image
-            ))
+        for p in found.prescriptions:
+            self.presc_tree.insert("", "end", values=(p.id, p.medicine, p.description, p.date, "Yes" if p.image_path else "No"))
 
     def add_new_prescription(self):
         if not hasattr(self, 'current_prescription_patient') or not self.current_prescription_patient:
             messagebox.showwarning("No Patient", "Please select patient first")
             return
+        self._reuse_popup('prescription', self._build_prescription_popup)
 
+    def _build_prescription_popup(self):
         popup = tk.Toplevel(self)
         popup.title("Add New Prescription")
         popup.geometry("500x500")
@@ -652,53 +894,84 @@ class HospitalManagementSystem(tk.Tk):
             entries[key].pack(side="left", padx=10)
 
         # Image Upload
-        image_base64 = [""]
+        image_source = [""]
         tk.Label(popup, text="Upload Image (optional):", bg="#f8fafc").pack(pady=5)
         def upload_image():
             file_path = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg *.jpeg *.png")])
             if file_path:
-                with open(file_path, "rb") as img_file:
-                    image_base64[0] = base64.b64encode(img_file.read()).decode('utf-8')
+                image_source[0] = file_path
                 messagebox.showinfo("Success", "Image uploaded!")
 
         tk.Button(popup, text="Upload", command=upload_image, bg="#3b82f6", fg="white").pack(pady=5)
 
-        # Auto-generate Prescription ID
-        patient_idx = patients_df[patients_df['id'] == self.current_prescription_patient.id].index[0]
-        current_prescriptions = patients_df.at[patient_idx, 'prescriptions']
-        pid = get_next_id(pd.DataFrame(current_prescriptions), 'id') if current_prescriptions else 1
-        tk.Label(popup, text=f"Prescription ID: {pid} (Auto-generated)", bg="#f8fafc", font=("Arial", 12)).pack(pady=10)
-
-        def save():
+        # Auto-generate Prescription ID, refreshed by reset() each time the popup is shown
+        target = {'pending': False}
+        id_label = tk.Label(popup, bg="#f8fafc", font=("Arial", 12))
+        id_label.pack(pady=10)
+
+        def add(patient, pid, values, image_paths=None):
+            image_path, thumb_path = image_paths.result() if image_paths else ("", "")
+            patient.prescriptions.append(Prescription(pid, *values, image_path, thumb_path))
+            self._schedule_save('patients', patient.id)
+            logging.info(f"New prescription {pid} added for patient {patient.id}")
+
+        def finish(add_prescription):
+            target['pending'] = False
+            if popup.winfo_exists():
+                save_button.config(state="normal")
             try:
-                medicine = entries["medicine"].get()
-                description = entries["description"].get()
-                date = entries["date"].get() or datetime.now().strftime("%Y-%m-%d")
-                new_presc = Prescription(pid, medicine, description, date, image_base64[0])
-                current_prescriptions.append(new_presc.to_dict())
-                patients_df.at[patient_idx, 'prescriptions'] = current_prescriptions
-                save_data()
-                logging.info(f"New prescription {pid} added for patient {self.current_prescription_patient.id}")
+                add_prescription()
                 messagebox.showinfo("Success", "Prescription added!")
-                popup.destroy()
+                if popup.winfo_exists():
+                    popup.withdraw()
                 self.load_patient_prescriptions()
             except Exception as e:
                 logging.error(f"Add prescription error: {str(e)}")
                 messagebox.showerror("Error", str(e))
 
-        tk.Button(popup, text="Save Prescription", command=save,
-                  bg="#10b981", fg="white", font=("Arial", 12, "bold")).pack(pady=25)
+        def save():
+            patient, pid = target['patient'], target['pid']
+            values = (entries["medicine"].get(), entries["description"].get(),
+                      entries["date"].get() or datetime.now().strftime("%Y-%m-%d"))
+            if not image_source[0]:
+                finish(lambda: add(patient, pid, values))
+                return
+            # Copying and thumbnailing a large upload would freeze the UI on the main thread
+            save_button.config(state="disabled")
+            target['pending'] = True
+            future = io_pool.submit(store_prescription_image, patient.id, pid, image_source[0])
+            # Kept until finish() runs, so destroy() can still record it if the app closes first
+            self._pending_uploads[future] = lambda: add(patient, pid, values, future)
+            self._when_done(future, lambda f: finish(self._pending_uploads.pop(f)))
+
+        save_button = tk.Button(popup, text="Save Prescription", command=save,
+                                bg="#10b981", fg="white", font=("Arial", 12, "bold"))
+        save_button.pack(pady=25)
+
+        def reset():
+            if target['pending']:
+                return  # The id is only taken once finish() appends; keep showing the save in progress
+            target['patient'] = self.current_prescription_patient
+            target['pid'] = target['patient'].next_prescription_id()
+            id_label.config(text=f"Prescription ID: {target['pid']} (Auto-generated)")
+            image_source[0] = ""
+            self._clear_entries(entries.values())
+
+        popup.reset = reset
+        return popup
 
     def delete_prescription(self):
         sel = self.presc_tree.selection()
         if not sel or not messagebox.askyesno("Confirm", "Delete this prescription?"):
             return
         pid = int(self.presc_tree.item(sel[0])["values"][0])
-        patient_idx = patients_df[patients_df['id'] == self.current_prescription_patient.id].index[0]
-        prescriptions = patients_df.at[patient_idx, 'prescriptions']
-        prescriptions = [p for p in prescriptions if p['id'] != pid]
-        patients_df.at[patient_idx, 'prescriptions'] = prescriptions
-        save_data()
+        patient = self.current_prescription_patient
+        for i, presc in enumerate(patient.prescriptions):
+            if presc.id == pid:
+                del patient.prescriptions[i]
+                remove_prescription_images(presc)
+                break
+        self._schedule_save('patients', patient.id)
         logging.info(f"Prescription {pid} deleted for patient {self.current_prescription_patient.id}")
         self.load_patient_prescriptions()
 
@@ -707,20 +980,48 @@ class HospitalManagementSystem(tk.Tk):
         if not sel:
             return
         pid = int(self.presc_tree.item(sel[0])["values"][0])
-        patient_idx = patients_df[patients_df['id'] == self.current_prescription_patient.id].index[0]
-        prescriptions = patients_df.at[patient_idx, 'prescriptions']
-        presc_dict = next((p for p in prescriptions if p['id'] == pid), None)
-        if presc_dict and presc_dict['image_base64']:
-            image_data = base64.b64decode(presc_dict['image_base64'])
-            image_popup = tk.Toplevel(self)
-            image_popup.title("Prescription Image")
-            img = tk.PhotoImage(data=image_data)
-            tk.Label(image_popup, image=img).pack()
-            image_popup.image = img  # Keep reference
+        prescriptions = self.current_prescription_patient.prescriptions
+        presc = next((p for p in prescriptions if p.id == pid), None)
+        if presc and presc.image_path:
+            self._show_prescription_image(presc)
         else:
             messagebox.showinfo("No Image", "No image available for this prescription.")
 
+    def _load_image_or_warn(self, path):
+        """Load an image file for display, or tell the user it is unavailable and return None."""
+        try:
+            return load_prescription_image(path)
+        except (OSError, tk.TclError) as e:  # Missing/moved file under images/ or an unreadable image
+            logging.warning(f"Cannot load image {path}: {str(e)}")
+            messagebox.showinfo("No Image", "No image available for this prescription.")
+            return None
+
+    def _show_prescription_image(self, presc):
+        # Show the thumbnail first; the full-resolution file is only decoded on request
+        img = self._load_image_or_warn(presc.thumb_path or presc.image_path)
+        if img is None:
+            return
+        image_popup = tk.Toplevel(self)
+        image_popup.title("Prescription Image")
+        image_label = tk.Label(image_popup, image=img)
+        image_label.pack()
+        image_popup.image = img  # Keep reference
+
+        def show_full_size():
+            full = self._load_image_or_warn(presc.image_path)
+            if full is None:
+                return
+            image_label.config(image=full)
+            image_popup.image = full
+
+        if presc.thumb_path:
+            tk.Button(image_popup, text="Full Size", command=show_full_size,
+                      bg="#3b82f6", fg="white", relief="flat").pack(pady=5)
+
     def change_patient_password(self):
+        self._reuse_popup('password', self._build_password_popup)
+
+    def _build_password_popup(self):
         popup = tk.Toplevel(self)
         popup.title("Change Patient Password")
         popup.geometry("450x350")
@@ -757,15 +1058,15 @@ class HospitalManagementSystem(tk.Tk):
                 if doctor_pw != self.current_user.password:
                     raise ValueError("Incorrect doctor password")
 
-                mask = patients_df['id'] == pid
-                if patients_df[mask].empty:
+                patient = patients_by_id.get(pid)
+                if patient is None:
                     raise ValueError("Patient not found")
 
-                patients_df.loc[mask, 'password'] = new_pw
-                save_data()
+                patient.password = new_pw
+                self._schedule_save('patients', pid)
                 logging.info(f"Password changed for patient {pid} by doctor {self.current_user.id}")
                 messagebox.showinfo("Success", "Password changed!")
-                popup.destroy()
+                popup.withdraw()
             except Exception as e:
                 logging.error(f"Change password error: {str(e)}")
                 messagebox.showerror("Error", str(e))
@@ -773,7 +1074,14 @@ class HospitalManagementSystem(tk.Tk):
         tk.Button(popup, text="Change Password", command=save,
                   bg="#10b981", fg="white", font=("Arial", 12, "bold")).pack(pady=25)
 
+        popup.reset = lambda: self._clear_entries(
+            (patient_id_entry, new_pass_entry, confirm_pass_entry, doctor_pass_entry))
+        return popup
+
     def add_patient(self):
+        self._reuse_popup('patient', self._build_patient_popup)
+
+    def _build_patient_popup(self):
         popup = tk.Toplevel(self)
         popup.title("Add New Patient")
         popup.geometry("450x400")
@@ -788,28 +1096,27 @@ class HospitalManagementSystem(tk.Tk):
             entries[key] = tk.Entry(popup, show=show, width=40)
             entries[key].pack(pady=5)
 
-        # Auto-generate Patient ID
-        pid = get_next_id(patients_df)
-        tk.Label(popup, text=f"Patient ID: {pid} (Auto-generated)", font=("Arial", 12)).pack(pady=10)
+        # Auto-generate Patient ID, refreshed by reset() each time the popup is shown
+        next_id = [0]
+        id_label = tk.Label(popup, font=("Arial", 12))
+        id_label.pack(pady=10)
 
         def save():
             try:
-                new_patient = {
-                    'id': pid,
-                    'name': entries["name"].get(),
-                    'age': int(entries["age"].get()),
-                    'ailment': entries["ailment"].get(),
-                    'password': entries["password"].get(),
-                    'reports': [],
-                    'bills': [],
-                    'prescriptions': []
-                }
-                global patients_df
-                patients_df = pd.concat([patients_df, pd.DataFrame([new_patient])], ignore_index=True)
-                save_data()
+                pid = next_id[0]
+                new_patient = Patient(
+                    pid,
+                    entries["name"].get(),
+                    int(entries["age"].get()),
+                    sys.intern(entries["ailment"].get()),
+                    entries["password"].get()
+                )
+                patients_by_id[pid] = new_patient
+                patient_search_index.append((pid, str(pid), new_patient.name.lower()))
+                self._schedule_save('patients', pid)
                 logging.info(f"New patient {pid} added")
                 messagebox.showinfo("Success", "Patient added")
-                popup.destroy()
+                popup.withdraw()
                 self.show_doctor_dashboard()
             except Exception as e:
                 logging.error(f"Add patient error: {str(e)}")
@@ -817,7 +1124,21 @@ class HospitalManagementSystem(tk.Tk):
 
         tk.Button(popup, text="Save", command=save, bg="#10b981", fg="white").pack(pady=20)
 
+        def reset():
+            next_id[0] = get_next_id(patients_by_id)
+            id_label.config(text=f"Patient ID: {next_id[0]} (Auto-generated)")
+            self._clear_entries(entries.values())
+
+        popup.reset = reset
+        return popup
+
     def schedule_appointment(self):
+        if not patients_by_id:
+            messagebox.showwarning("No Patients", "Please add patients first")
+            return
+        self._reuse_popup('appointment', self._build_appointment_popup)
+
+    def _build_appointment_popup(self):
         popup = tk.Toplevel(self)
         popup.title("Schedule Appointment")
         popup.geometry("500x450")
@@ -826,17 +1147,12 @@ class HospitalManagementSystem(tk.Tk):
 
         # Patient selection
         tk.Label(popup, text="Select Patient:").pack(pady=5)
-        patient_list = [(row['id'], f"{row['id']} - {row['name']}") for _, row in patients_df.iterrows()]
-        if not patient_list:
-            messagebox.showwarning("No Patients", "Please add patients first")
-            popup.destroy()
-            return
+        # Combobox label -> patient ID, so the selection resolves with one lookup on save
+        patient_ids_by_label = {}
 
         patient_var = tk.StringVar()
-        patient_combo = ttk.Combobox(popup, textvariable=patient_var,
-                                     values=[name for _, name in patient_list], width=40, state="readonly")
+        patient_combo = ttk.Combobox(popup, textvariable=patient_var, width=40, state="readonly")
         patient_combo.pack(pady=5)
-        patient_combo.current(0)
 
         fields = [("Date (YYYY-MM-DD):", "date"), ("Time (HH:MM):", "time")]
 
@@ -846,29 +1162,30 @@ class HospitalManagementSystem(tk.Tk):
             entries[key] = tk.Entry(popup, width=40)
             entries[key].pack(pady=5)
 
-        # Auto-generate Appointment ID
-        app_id = get_next_id(appointments_df)
-        tk.Label(popup, text=f"Appointment ID: {app_id} (Auto-generated)", font=("Arial", 12)).pack(pady=10)
+        # Auto-generate Appointment ID, refreshed by reset() each time the popup is shown
+        next_id = [0]
+        id_label = tk.Label(popup, font=("Arial", 12))
+        id_label.pack(pady=10)
 
         def save():
             try:
                 # Get selected patient ID
                 selected_name = patient_var.get()
-                patient_id = next(pid for pid, name in patient_list if name == selected_name)
-
-                new_app = {
-                    'id': app_id,
-                    'patient_id': patient_id,
-                    'doctor_id': self.current_user.id,
-                    'date': entries["date"].get() or datetime.now().strftime("%Y-%m-%d"),
-                    'time': entries["time"].get()
-                }
-                global appointments_df
-                appointments_df = pd.concat([appointments_df, pd.DataFrame([new_app])], ignore_index=True)
-                save_data()
+                patient_id = patient_ids_by_label[selected_name]
+
+                app_id = next_id[0]
+                new_app = Appointment(
+                    app_id,
+                    patient_id,
+                    self.current_user.id,
+                    entries["date"].get() or datetime.now().strftime("%Y-%m-%d"),
+                    entries["time"].get()
+                )
+                appointments_by_id[app_id] = new_app
+                self._schedule_save('appointments')
                 logging.info(f"New appointment {app_id} scheduled")
                 messagebox.showinfo("Success", "Appointment scheduled!")
-                popup.destroy()
+                popup.withdraw()
                 self.show_doctor_dashboard()
             except Exception as e:
                 logging.error(f"Schedule appointment error: {str(e)}")
@@ -877,10 +1194,24 @@ class HospitalManagementSystem(tk.Tk):
         tk.Button(popup, text="Schedule", command=save,
                   bg="#3b82f6", fg="white", font=("Arial", 12, "bold")).pack(pady=25)
 
+        def reset():
+            patient_ids_by_label.clear()
+            patient_ids_by_label.update((f"{p.id} - {p.name}", p.id) for p in patients_by_id.values())
+            patient_combo.config(values=list(patient_ids_by_label))
+            patient_combo.current(0)
+            next_id[0] = get_next_id(appointments_by_id)
+            id_label.config(text=f"Appointment ID: {next_id[0]} (Auto-generated)")
+            self._clear_entries(entries.values())
+
+        popup.reset = reset
+        return popup
+
     def export_patients_csv(self):
         try:
-            export_df = patients_df[['id', 'name', 'age', 'ailment']].copy()
-            export_df.to_csv('patients_export.csv', index=False)
+            import pandas as pd
+            export_df = pd.DataFrame([(p.id, p.name, p.age, p.ailment) for p in patients_by_id.values()],
+                                     columns=['id', 'name', 'age', 'ailment'])
+            write_csv(export_df, 'patients_export.csv')
             messagebox.showinfo("Success", "Patients exported to patients_export.csv")
             logging.info("Patients exported to CSV")
         except Exception as e:
@@ -892,29 +1223,90 @@ class HospitalManagementSystem(tk.Tk):
             messagebox.showwarning("No Patient", "Please select patient first")
             return
         try:
-            bills = self.current_bill_patient.bills
-            bills_df = pd.DataFrame([b.to_dict() for b in bills]) if bills else pd.DataFrame()
-            bills_df.to_csv(f"bills_{self.current_bill_patient.id}.csv", index=False)
+            bills_df = patient_bills_frame(self.current_bill_patient)
+            write_csv(bills_df, f"bills_{self.current_bill_patient.id}.csv")
             messagebox.showinfo("Success", f"Bills exported to bills_{self.current_bill_patient.id}.csv")
             logging.info(f"Bills exported for patient {self.current_bill_patient.id}")
         except Exception as e:
             logging.error(f"Export bills error: {str(e)}")
             messagebox.showerror("Error", str(e))
 
+    def _when_done(self, future: Future, callback):
+        """Call callback(future) on the Tk thread once a worker future has finished."""
+        if future.done():
+            callback(future)
+        else:
+            self.after(IO_POLL_MS, self._when_done, future, callback)
+
+    def _reuse_popup(self, name, build):
+        """Show the popup cached under name, building its widgets only on first use."""
+        popup = self._popups.get(name)
+        if popup is None or not popup.winfo_exists():
+            popup = self._popups[name] = build()
+            popup.protocol("WM_DELETE_WINDOW", popup.withdraw)
+        else:
+            popup.deiconify()
+            popup.lift()
+        popup.reset()
+        return popup
+
+    @staticmethod
+    def _clear_entries(entries):
+        for entry in entries:
+            entry.delete(0, "end")
+
+    def _configure_bill_tags(self, tree):
+        # Done once per tree; rows only reference the tags afterwards
+        tree.tag_configure("pending", foreground="#dc2626", font=("Arial", 10, "bold"))
+        tree.tag_configure("paid", foreground="#16a34a")
+
     def clear_window(self):
+        popups = set(self._popups.values())
         for widget in self.winfo_children():
-            widget.destroy()
+            if widget in popups:
+                widget.withdraw()  # Kept hidden for reuse
+            else:
+                widget.destroy()
+
+    def _schedule_save(self, store, patient_id=None):
+        # Debounce: a burst of edits results in a single write per touched file
+        self._dirty.add(store)
+        if patient_id is not None:
+            self._dirty_patients.add(patient_id)
+        if self._save_job is not None:
+            self.after_cancel(self._save_job)
+        self._save_job = self.after(500, self._flush_save)
+
+    def _flush_save(self):
+        self._save_job = None
+        if self._dirty:
+            save_data(self._dirty, self._dirty_patients)
+            self._dirty = set()
+            self._dirty_patients = set()
+
+    def destroy(self):
+        # Closing the window or destroying the app programmatically both land here
+        # Image copies still running would otherwise lose their prescription with the pending after() poll
+        for add_prescription in self._pending_uploads.values():
+            try:
+                add_prescription()  # Blocks on the copy/thumbnail future
+            except Exception as e:
+                logging.error(f"Add prescription error: {str(e)}")
+        self._pending_uploads.clear()
+        if self._save_job is not None:
+            self.after_cancel(self._save_job)
+        self._flush_save()
+        super().destroy()
 
 
 if __name__ == "__main__":
     load_data()
 
-    if doctors_df.empty:
+    if not doctors_by_id:
         print("\n" + "="*70)
         print("NO DOCTORS FOUND → Creating default admin doctor...")
-        default = {'id': 1001, 'name': "Dr. Admin", 'specialization': "Administrator", 'password': "admin123"}
-        doctors_df = pd.concat([doctors_df, pd.DataFrame([default])], ignore_index=True)
-        save_data()
+        doctors_by_id[1001] = Doctor(1001, "Dr. Admin", "Administrator", "admin123")
+        save_data(('doctors',))
         print("Default Doctor: ID = 1001 | Password = admin123")
         print("="*70 + "\n")
 